@@ -0,0 +1,345 @@
+"""
+Long-running local alignment service, so small batches do not pay interpreter, import and process pool startup.
+
+The server keeps a warm ProcessPoolExecutor and caches gene panels by digest. Each worker process builds the Gene
+objects of a panel the first time it aligns against it and keeps them, so a chunk of reads only carries the panel
+digest. Clients send read batches and get back AlignOneRead results one chunk at a time, as the chunks finish.
+JunkReadRecovery routes through a server when it is given server=ADDRESS or when the ALIGNMENT_SERVER environment
+variable is set.
+
+ADDRESS is a Unix socket path, or host:port for TCP on a loopback address, e.g.
+    python AlignmentServer.py serve /tmp/alignment.sock --panel Simulation/sim_0.json &
+    ALIGNMENT_SERVER=/tmp/alignment.sock python eval_recovery.py
+    python AlignmentServer.py stop /tmp/alignment.sock
+
+Messages are JSON objects prefixed with their length as an 8-byte big-endian integer. The server has no
+authentication, so it refuses to listen on anything but a Unix socket or a loopback address.
+"""
+
+import argparse
+import hashlib
+import ipaddress
+import json
+import multiprocessing
+import os
+import socket
+import socketserver
+import stat
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from Gene import Gene
+from Read import Read
+from JunkReadRecovery import AlignOneRead
+
+ALIGN_PARAMS = ['match_reward', 'mismatch_penalty', 'indel_penalty', 'overlap_match_score', 'overlap_mismatch_score']
+
+# Set in each worker process by InitWorker: the server's panels, shared through a multiprocessing manager,
+# and the Gene objects built from them in this worker, both keyed by digest
+shared_panels = None
+worker_panels = {}
+
+
+def SendMessage(sock: socket.socket, message: Dict) -> None:
+    payload = json.dumps(message).encode()
+    sock.sendall(struct.pack('>Q', len(payload)) + payload)
+
+
+def ReceiveMessage(sock_file) -> Dict|None:
+    header = sock_file.read(8)
+    if len(header) < 8:
+        return None
+    (length,) = struct.unpack('>Q', header)
+    payload = sock_file.read(length)
+    if len(payload) < length:
+        raise ConnectionError('Connection closed in the middle of a message')
+    return json.loads(payload)
+
+
+def PanelDigest(v_genes: List[Dict], j_genes: List[Dict]) -> str:
+    """
+    Digest identifying a gene panel
+
+    Parameters
+    ----------
+    v_genes : List[Dict], V genes in Gene.__json__ form
+    j_genes : List[Dict], J genes in Gene.__json__ form
+    """
+    return hashlib.sha1(json.dumps([v_genes, j_genes], sort_keys=True).encode()).hexdigest()
+
+
+def ParseAddress(address: str) -> Tuple[int, str|Tuple[str, int]]:
+    """
+    Socket family and address for a Unix socket path or host:port, raise ValueError if host is not a loopback address
+
+    Parameters
+    ----------
+    address : str, Unix socket path or host:port
+    """
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        host = host.strip('[]') or '127.0.0.1'
+        try:
+            loopback = host == 'localhost' or ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            loopback = False
+        if not loopback:
+            raise ValueError(f'Alignment server address {address} is not a Unix socket or a loopback address')
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        return family, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def InitWorker(panels) -> None:
+    global shared_panels
+    shared_panels = panels
+
+
+def AlignReadChunk(digest: str, params: Dict, reads: List[Dict]) -> List[Dict]:
+    """
+    Align a chunk of reads in a worker process
+
+    Parameters
+    ----------
+    digest : str, digest of a panel loaded with AlignmentServer.load_panel
+    params : Dict, alignment parameters, see ALIGN_PARAMS
+    reads : List[Dict], reads in Read.__json__ form
+    """
+    if digest not in worker_panels:
+        v_genes, j_genes = shared_panels[digest]
+        worker_panels[digest] = ([Gene(**d) for d in v_genes], [Gene(**d) for d in j_genes])
+    v_genes, j_genes = worker_panels[digest]
+    return [AlignOneRead(*[params[p] for p in ALIGN_PARAMS], v_genes, j_genes, Read(**d)) for d in reads]
+
+
+class AlignmentServer:
+    def __init__(self: object,
+                 address: str,
+                 max_workers: int|None = None) -> None:
+        self.address = address
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.panels = {}
+        self.manager = multiprocessing.Manager()
+        self.shared_panels = self.manager.dict()
+        self.executor = ProcessPoolExecutor(self.max_workers, initializer=InitWorker, initargs=(self.shared_panels,))
+        # Start the worker processes now rather than on the first request
+        list(self.executor.map(abs, range(self.max_workers)))
+        self.server = None
+
+    def __str__(self: object) -> str:
+        return f"AlignmentServer(address={self.address}, max_workers={self.max_workers}, panels={len(self.panels)})"
+
+    def load_panel(self: object, v_genes: List[Dict], j_genes: List[Dict]) -> str:
+        """
+        Cache a gene panel and return its digest
+
+        Parameters
+        ----------
+        v_genes : List[Dict], V genes in Gene.__json__ form
+        j_genes : List[Dict], J genes in Gene.__json__ form
+        """
+        digest = PanelDigest(v_genes, j_genes)
+        if digest not in self.panels:
+            self.panels[digest] = (v_genes, j_genes)
+            self.shared_panels[digest] = (v_genes, j_genes)
+        return digest
+
+    def align(self: object, digest: str, params: Dict, reads: List[Dict]) -> Iterator[Tuple[int, List[Dict]]]:
+        """
+        Align reads against a cached panel, yield (start, results) for each chunk of reads as soon as it is done,
+        where results are the AlignOneRead results of reads[start:start + len(results)]
+
+        Parameters
+        ----------
+        digest : str, digest of a panel loaded with load_panel
+        params : Dict, alignment parameters, see ALIGN_PARAMS
+        reads : List[Dict], reads in Read.__json__ form
+        """
+        # A few chunks per worker balances load, small chunks would add messages without adding throughput
+        chunk_size = max(1, -(-len(reads) // (4 * self.max_workers)))
+        futures = {self.executor.submit(AlignReadChunk, digest, params, reads[i:i + chunk_size]): i
+                   for i in range(0, len(reads), chunk_size)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def handle(self: object, message: Dict) -> Iterator[Dict]:
+        """
+        Responses to a message, one for each op except align, which sends one per chunk and then {'done': True}
+        """
+        op = message.get('op')
+        if op == 'ping':
+            yield {'ok': True, 'panels': list(self.panels)}
+        elif op == 'load_panel':
+            yield {'ok': True, 'digest': self.load_panel(message['v_genes'], message['j_genes'])}
+        elif op == 'align':
+            if message['digest'] not in self.panels:
+                yield {'ok': False, 'error': 'unknown_panel'}
+                return
+            for start, results in self.align(message['digest'], message['params'], message['reads']):
+                yield {'ok': True, 'start': start, 'results': results}
+            yield {'ok': True, 'done': True}
+        elif op == 'shutdown':
+            threading.Thread(target=self.server.shutdown).start()
+            yield {'ok': True}
+        else:
+            yield {'ok': False, 'error': f'unknown op {op}'}
+
+    def bind_unix_socket(self: object, path: str, handler) -> socketserver.ThreadingUnixStreamServer:
+        """
+        Bind a Unix socket server to path, replacing a socket left behind by a server that is no longer running
+
+        Raises FileExistsError if path is not a socket, or if a server is still listening on it.
+
+        Parameters
+        ----------
+        path : str, Unix socket path
+        handler : socketserver.BaseRequestHandler subclass
+        """
+        if os.path.lexists(path):
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise FileExistsError(f'{path} exists and is not a socket')
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                try:
+                    sock.connect(path)
+                except ConnectionRefusedError:
+                    os.remove(path)
+                else:
+                    raise FileExistsError(f'An alignment server is already listening on {path}')
+        return socketserver.ThreadingUnixStreamServer(path, handler)
+
+    def serve_forever(self: object) -> None:
+        family, address = ParseAddress(self.address)
+        alignment_server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while (message := ReceiveMessage(self.rfile)) is not None:
+                    try:
+                        for response in alignment_server.handle(message):
+                            SendMessage(self.connection, response)
+                    except Exception as e:
+                        SendMessage(self.connection, {'ok': False, 'error': f'{type(e).__name__}: {e}'})
+
+        if family == socket.AF_UNIX:
+            self.server = self.bind_unix_socket(address, Handler)
+        else:
+            server_class = type('ThreadingTCPServer', (socketserver.ThreadingTCPServer,), {'address_family': family})
+            self.server = server_class(address, Handler)
+        self.server.daemon_threads = True
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self.executor.shutdown()
+            self.manager.shutdown()
+            if family == socket.AF_UNIX and os.path.exists(address):
+                os.remove(address)
+
+
+class AlignmentClient:
+    def __init__(self: object,
+                 address: str) -> None:
+        self.address = address
+        family, sock_address = ParseAddress(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(sock_address)
+        self.sock_file = self.sock.makefile('rb')
+
+    def __str__(self: object) -> str:
+        return f"AlignmentClient(address={self.address})"
+
+    def __enter__(self: object) -> 'AlignmentClient':
+        return self
+
+    def __exit__(self: object, *exc) -> None:
+        self.close()
+
+    def close(self: object) -> None:
+        self.sock_file.close()
+        self.sock.close()
+
+    def request(self: object, message: Dict) -> Dict:
+        SendMessage(self.sock, message)
+        return self.receive()
+
+    def receive(self: object) -> Dict:
+        response = ReceiveMessage(self.sock_file)
+        if response is None:
+            raise ConnectionError(f'Alignment server at {self.address} closed the connection')
+        return response
+
+    def ping(self: object) -> Dict:
+        return self.request({'op': 'ping'})
+
+    def shutdown(self: object) -> None:
+        self.request({'op': 'shutdown'})
+
+    def align_reads(self: object, match_reward: int, mismatch_penalty: int, indel_penalty: int,
+                    overlap_match_score: int, overlap_mismatch_score: int,
+                    v_genes: List[Gene], j_genes: List[Gene], reads: List[Read],
+                    callback: Callable[[Dict], None]|None = None) -> List[Dict]:
+        """
+        Align reads on the server, return AlignOneRead results in input order
+
+        The panel is only sent if the server does not have it cached yet. The server sends results back one chunk
+        at a time, and callback, if given, is called with each result as soon as its chunk arrives.
+
+        Parameters
+        ----------
+        match_reward : int, reward for matching nucleotides
+        mismatch_penalty : int, penalty for mismatching nucleotides
+        indel_penalty : int, penalty for indels
+        overlap_match_score : int, reward for matching nucleotides in the overlap region
+        overlap_mismatch_score : int, penalty for mismatching nucleotides in the overlap region
+        v_genes : List[Gene], V genes
+        j_genes : List[Gene], J genes
+        reads : List[Read], reads
+        callback : Callable[[Dict], None], called with each AlignOneRead result
+        """
+        v_genes = [g.__json__() if isinstance(g, Gene) else g for g in v_genes]
+        j_genes = [g.__json__() if isinstance(g, Gene) else g for g in j_genes]
+        params = dict(zip(ALIGN_PARAMS, [match_reward, mismatch_penalty, indel_penalty, overlap_match_score, overlap_mismatch_score]))
+        message = {'op': 'align', 'digest': PanelDigest(v_genes, j_genes), 'params': params,
+                   'reads': [r.__json__() if isinstance(r, Read) else r for r in reads]}
+        response = self.request(message)
+        if not response['ok'] and response['error'] == 'unknown_panel':
+            self.request({'op': 'load_panel', 'v_genes': v_genes, 'j_genes': j_genes})
+            response = self.request(message)
+        results = [None] * len(message['reads'])
+        while not response.get('done'):
+            if not response['ok']:
+                raise RuntimeError(f'Alignment server error: {response["error"]}')
+            results[response['start']:response['start'] + len(response['results'])] = response['results']
+            if callback is not None:
+                for result in response['results']:
+                    callback(result)
+            response = self.receive()
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='run the alignment server')
+    serve_parser.add_argument('address')
+    serve_parser.add_argument('--panel', default=None, help='simulation JSON whose gene panel is loaded at startup')
+    serve_parser.add_argument('--workers', type=int, default=None)
+
+    stop_parser = subparsers.add_parser('stop', help='stop a running alignment server')
+    stop_parser.add_argument('address')
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        server = AlignmentServer(args.address, args.workers)
+        if args.panel is not None:
+            with open(args.panel) as f:
+                data = json.load(f)
+            server.load_panel(data['v_genes'], data['j_genes'])
+        print(f'Serving {server}')
+        server.serve_forever()
+    elif args.command == 'stop':
+        with AlignmentClient(args.address) as client:
+            client.shutdown()
@@ -1,8 +1,7 @@
 from itertools import combinations
 from typing import Dict, Set
 import json
-from JunkReadRecovery import JunkReadRecovery
-from BuildEpiReadDict import build_epitope_reads_dict
+from BuildEpiReadDict import build_epitope_reads_dict, is_epitope_read_index
 
 def brute_force_max_coverage(epitope_reads_dict: Dict, k: int) -> Set:
     """
@@ -11,7 +10,7 @@ def brute_force_max_coverage(epitope_reads_dict: Dict, k: int) -> Set:
     Parameters
     ----------
     epitope_reads_dict : Dict
-        A dictionary with epitopes as keys and a list of reads as values (epitopes).
+        A dictionary with epitopes as keys and a list of reads as values (epitopes), or an EpitopeReadIndex.
     k : int
         The number of epitopes to select.
     
@@ -20,6 +19,8 @@ def brute_force_max_coverage(epitope_reads_dict: Dict, k: int) -> Set:
     Set
         The set of k epitopes that maximizes the coverage.
     """
+    if is_epitope_read_index(epitope_reads_dict):
+        return brute_force_max_coverage_index(epitope_reads_dict, k)
     max_coverage = 0
     best_combination = set()
 
@@ -38,7 +39,37 @@ def brute_force_max_coverage(epitope_reads_dict: Dict, k: int) -> Set:
     return best_combination, max_coverage
 
 
+def brute_force_max_coverage_index(index, k: int) -> Set:
+    """
+    Brute force max coverage on an EpitopeReadIndex, the counterpart of brute_force_max_coverage.
+
+    The coverage can differ by one from brute_force_max_coverage on the epitope_reads_dict of the same results:
+    the index counts overlap read 0 and random read 0 as two reads, the dict as one (see EpitopeReadIndex).
+
+    The coverage of each combination is counted by marking its CSR rows in a reusable boolean array.
+    """
+    import numpy as np
+
+    max_coverage = 0
+    best_combination = set()
+    covered = np.zeros(index.n_reads, dtype=bool)
+    for combination in combinations(range(index.n_epitopes), k):
+        rows = [index.indices[index.indptr[e]:index.indptr[e+1]] for e in combination]
+        coverage = 0
+        for row in rows:
+            coverage += int(np.count_nonzero(~covered[row]))
+            covered[row] = True
+        for row in rows:
+            covered[row] = False
+        if coverage > max_coverage:
+            max_coverage = coverage
+            best_combination = set(index.epitopes[e] for e in combination)
+    return best_combination, max_coverage
+
+
 if __name__ == "__main__":
+    from JunkReadRecovery import JunkReadRecovery
+
     with open('./Simulation/sim_3_7.json') as f:
         data = json.load(f)
 
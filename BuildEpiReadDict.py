@@ -1,24 +1,62 @@
 import json
-from Gene import Gene
-from Read import Read
-from JunkReadRecovery import JunkReadRecovery
+import sys
 from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
 
 
 def build_epitope_reads_dict(final_json):
     epitope_reads_dict = defaultdict(list)
-    read_overlap = final_json['high_score_overlap']
-    read_random = final_json['high_score_random']
-    for read in read_overlap:
-        for epitope in list(set(read['v_gene_epi'] + read['j_gene_epi'])):
-            epitope_reads_dict[epitope].append(read['read_id'])
-    for read in read_random:
-        for epitope in list(set(read['v_gene_epi'] + read['j_gene_epi'])):
-            epitope_reads_dict[epitope].append(-read['read_id'])
+    for epitope, read_id in iter_epitope_read_pairs(final_json):
+        epitope_reads_dict[epitope].append(read_id)
     return epitope_reads_dict
 
 
+def iter_epitope_read_pairs(final_json: Dict) -> Iterable[Tuple[str, int]]:
+    """
+    Yield the (epitope, read_id) pairs of the output of JunkReadRecovery, random reads get -read_id
+
+    Parameters
+    ----------
+    final_json : Dict, output of JunkReadRecovery
+    """
+    for read in final_json['high_score_overlap']:
+        yield from read_epitope_pairs(read, False)
+    for read in final_json['high_score_random']:
+        yield from read_epitope_pairs(read, True)
+
+
+def read_epitope_pairs(read: Dict, random: bool) -> List[Tuple[str, int]]:
+    """
+    The (epitope, read_id) pairs of one alignment result, random reads get -read_id
+
+    Parameters
+    ----------
+    read : Dict, result of AlignOneRead
+    random : bool, whether the read is a random read
+    """
+    read_id = -read['read_id'] if random else read['read_id']
+    return [(epitope, read_id) for epitope in list(set(read['v_gene_epi'] + read['j_gene_epi']))]
+
+
+def is_epitope_read_index(obj) -> bool:
+    """
+    Whether obj is an EpitopeReadIndex, without importing numpy unless EpitopeReadIndex is already loaded
+    """
+    module = sys.modules.get('EpitopeReadIndex')
+    return module is not None and isinstance(obj, module.EpitopeReadIndex)
+
+
+def __getattr__(name):
+    # EpitopeReadIndex needs numpy, so it is only imported when asked for
+    if name in ['EpitopeReadIndex', 'build_epitope_read_index']:
+        import EpitopeReadIndex
+        return getattr(EpitopeReadIndex, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == "__main__":
+    from JunkReadRecovery import JunkReadRecovery
+
     with open('./Simulation/sim_3_7.json') as f:
         data = json.load(f)
 
@@ -1,16 +1,33 @@
 import numpy as np
-import pandas as pd
+import os
 import random
 import json
+from functools import lru_cache
 from Read import Read
 from Gene import Gene
 from typing import List, Tuple, Dict
 
-with open('data.json') as f:
-    data = json.load(f)
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data.json')
 
-nts = data['nucleotides']
-amino_acids = data['amino_acids']
+
+@lru_cache(maxsize=None)
+def load_reference_data() -> Dict:
+    """
+    Load the nucleotide and amino acid reference data, once, on first use
+    """
+    with open(DATA_PATH) as f:
+        return json.load(f)
+
+
+def __getattr__(name):
+    # Keep DataSimulation.data, .nts and .amino_acids available without reading data.json at import time
+    if name == 'data':
+        return load_reference_data()
+    if name == 'nts':
+        return load_reference_data()['nucleotides']
+    if name == 'amino_acids':
+        return load_reference_data()['amino_acids']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Function to simulate data
@@ -56,7 +73,7 @@ def simulate_epitopes(n_epitopes: int) -> List:
     len_epitope : int, length of the epitopes
     """
     epitopes = []
-    amino_acids_list = list(amino_acids.keys())
+    amino_acids_list = list(load_reference_data()['amino_acids'].keys())
     len_epitopes = random.randint(8, 11)
     for i in range(n_epitopes):
         epitope = ''.join(random.choice(amino_acids_list) for _ in range(len_epitopes))
@@ -81,7 +98,7 @@ def simulate_overlap_reads(n_reads: int, len_read: int, v_gene_pool: Dict, j_gen
         j_gene = random.choice(j_gene_pool)
 
         v_gene_seq = v_gene.seq
-        j_gene_seq = v_gene.seq
+        j_gene_seq = j_gene.seq
 
         len_v_overlap = random.randint(0, min(len_read, len(v_gene_seq)))
         len_j_overlap = random.randint(0, min(len_read - len_v_overlap, len(j_gene_seq)))
@@ -159,6 +176,238 @@ def simulate(num_epitopes: int, num_v_genes: int, num_j_genes: int, num_reads: i
         }
 
 
+# Batched simulator for large benchmark datasets
+NT_CODES = np.frombuffer(b'ACGTN', dtype=np.uint8)
+NT_PROBS = np.array([0.245, 0.245, 0.245, 0.245, 0.02])
+MAX_LEN_D = 11
+# Reads are drawn in blocks of this size, each from its own child of the seed, so the output does not depend on chunk_size
+RNG_BLOCK_SIZE = 1000
+
+
+def random_nt_matrix(n: int, length: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Generate n random nucleotide sequences as an (n, length) matrix of ASCII codes
+
+    Parameters
+    ----------
+    n : int, number of sequences
+    length : int, length of the sequences
+    rng : np.random.Generator, random number generator
+    """
+    return NT_CODES[rng.choice(len(NT_CODES), size=(n, length), p=NT_PROBS)]
+
+
+def nt_matrix_to_strings(matrix: np.ndarray) -> List[str]:
+    """
+    Convert an (n, length) matrix of ASCII codes to a list of strings
+
+    Parameters
+    ----------
+    matrix : np.ndarray, matrix of ASCII codes
+    """
+    n, length = matrix.shape
+    if length == 0:
+        return [''] * n
+    return np.ascontiguousarray(matrix).view(f'S{length}').ravel().astype(str).tolist()
+
+
+def overlap_length_table(len_read: int, len_v_gene: int, len_j_gene: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Enumerate every valid (len_v_overlap, len_d) pair with its probability
+
+    simulate_overlap_reads draws len_v_overlap uniformly, then len_j_overlap uniformly from what is left,
+    and rejects the read unless 0 < len_d < 12. Conditioning that process on acceptance gives the
+    probabilities below, so overlap lengths can be sampled directly instead of by rejection.
+
+    Parameters
+    ----------
+    len_read : int, length of the reads
+    len_v_gene : int, length of the V genes
+    len_j_gene : int, length of the J genes
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray], len_v_overlap, len_d, probabilities
+    """
+    max_v = min(len_read, len_v_gene)
+    len_v, len_d = np.meshgrid(np.arange(max_v + 1), np.arange(1, MAX_LEN_D + 1), indexing='ij')
+    len_v, len_d = len_v.ravel(), len_d.ravel()
+    len_j = len_read - len_v - len_d
+    max_j = np.minimum(len_read - len_v, len_j_gene)
+    valid = (len_j >= 0) & (len_j <= max_j)
+    if not valid.any():
+        raise ValueError('No valid overlap lengths for the given read and gene lengths')
+    len_v, len_d, max_j = len_v[valid], len_d[valid], max_j[valid]
+    prob = 1 / ((max_v + 1) * (max_j + 1))
+    return len_v, len_d, prob / prob.sum()
+
+
+def gene_matrix(genes: List[Gene]) -> np.ndarray:
+    """
+    Stack gene sequences into an (n_genes, len_gene) matrix of ASCII codes
+
+    Parameters
+    ----------
+    genes : List[Gene], genes of equal length
+    """
+    lengths = {len(gene.seq) for gene in genes}
+    if len(lengths) != 1:
+        raise ValueError('Batched simulation requires all genes of a type to have the same length')
+    return np.frombuffer(''.join(gene.seq for gene in genes).encode(), dtype=np.uint8).reshape(len(genes), -1)
+
+
+def simulate_epitopes_batched(n_epitopes: int, rng: np.random.Generator) -> List:
+    """
+    Simulate epitopes with a seeded generator
+
+    Parameters
+    ----------
+    n_epitopes : int, number of epitopes to simulate
+    rng : np.random.Generator, random number generator
+    """
+    amino_acids_codes = np.frombuffer(''.join(load_reference_data()['amino_acids'].keys()).encode(), dtype=np.uint8)
+    len_epitopes = int(rng.integers(8, 12))
+    return nt_matrix_to_strings(amino_acids_codes[rng.integers(0, len(amino_acids_codes), size=(n_epitopes, len_epitopes))])
+
+
+def simulate_vj_genes_batched(n_genes: int, len_gene: int, epitope_pool: List, gene_type: str,
+                              rng: np.random.Generator) -> List:
+    """
+    Simulate V and J genes with a seeded generator
+
+    Parameters
+    ----------
+    n_genes : int, number of genes to simulate
+    len_gene : int, length of the genes
+    epitope_pool : List, epitopes
+    gene_type : str, 'V' or 'J'
+    rng : np.random.Generator, random number generator
+    """
+    seqs = nt_matrix_to_strings(random_nt_matrix(n_genes, len_gene, rng))
+    num_epitopes = rng.integers(1, 5, size=n_genes)
+    return [Gene(seq, gene_type, [epitope_pool[i] for i in rng.choice(len(epitope_pool), size=min(k, len(epitope_pool)), replace=False)])
+            for seq, k in zip(seqs, num_epitopes)]
+
+
+def simulate_overlap_reads_batched(n_reads: int, len_read: int, v_gene_pool: List, j_gene_pool: List,
+                                   rng: np.random.Generator, start_id: int = 0) -> List[Dict]:
+    """
+    Simulate a batch of reads that overlap with genes, returned in Read.__json__ form
+
+    Parameters
+    ----------
+    n_reads : int, number of reads to simulate
+    len_read : int, length of the reads
+    v_gene_pool : List, V genes
+    j_gene_pool : List, J genes
+    rng : np.random.Generator, random number generator
+    start_id : int, id of the first read in the batch
+    """
+    v_matrix, j_matrix = gene_matrix(v_gene_pool), gene_matrix(j_gene_pool)
+    len_v_gene, len_j_gene = v_matrix.shape[1], j_matrix.shape[1]
+    table_v, table_d, table_prob = overlap_length_table(len_read, len_v_gene, len_j_gene)
+
+    v_idx = rng.integers(0, len(v_gene_pool), size=n_reads)
+    j_idx = rng.integers(0, len(j_gene_pool), size=n_reads)
+    choice = rng.choice(len(table_prob), size=n_reads, p=table_prob)
+    len_v_overlap, len_d = table_v[choice], table_d[choice]
+    d_start, j_start = len_v_overlap, len_v_overlap + len_d
+
+    # Column c of a read comes from the V tail, the random D segment or the J head
+    cols = np.arange(len_read)[None, :]
+    v_cols = np.clip(len_v_gene - len_v_overlap[:, None] + cols, 0, len_v_gene - 1)
+    j_cols = np.clip(cols - j_start[:, None], 0, len_j_gene - 1)
+    read_matrix = np.where(cols < d_start[:, None], v_matrix[v_idx[:, None], v_cols],
+                           np.where(cols < j_start[:, None], random_nt_matrix(n_reads, len_read, rng),
+                                    j_matrix[j_idx[:, None], j_cols]))
+    read_seqs = nt_matrix_to_strings(read_matrix)
+
+    pair_epitopes = {}
+    reads = []
+    for i, (read_seq, v, j, d0, j0) in enumerate(zip(read_seqs, v_idx.tolist(), j_idx.tolist(), d_start.tolist(), j_start.tolist())):
+        if (v, j) not in pair_epitopes:
+            # dict.fromkeys dedupes in a stable order, set order would depend on PYTHONHASHSEED
+            pair_epitopes[(v, j)] = list(dict.fromkeys(v_gene_pool[v].epitopes + j_gene_pool[j].epitopes))
+        reads.append({
+            'seq': read_seq,
+            'id': start_id + i,
+            'v_gene': v_gene_pool[v].seq,
+            'd_gene': read_seq[d0:j0],
+            'j_gene': j_gene_pool[j].seq,
+            'epitopes': pair_epitopes[(v, j)]
+        })
+    return reads
+
+
+def simulate_random_reads_batched(n_reads: int, len_read: int, rng: np.random.Generator, start_id: int = 0) -> List[Dict]:
+    """
+    Simulate a batch of random reads, returned in Read.__json__ form
+
+    Parameters
+    ----------
+    n_reads : int, number of reads to simulate
+    len_read : int, length of the reads
+    rng : np.random.Generator, random number generator
+    start_id : int, id of the first read in the batch
+    """
+    read_seqs = nt_matrix_to_strings(random_nt_matrix(n_reads, len_read, rng))
+    return [{'seq': seq, 'id': start_id + i, 'v_gene': '', 'd_gene': '', 'j_gene': '', 'epitopes': []}
+            for i, seq in enumerate(read_seqs)]
+
+
+def simulate_to_file(save_path: str, num_epitopes: int, num_v_genes: int, num_j_genes: int, num_reads: int, len_read: int,
+                     seed: int|None = None, chunk_size: int = 50000) -> None:
+    """
+    Simulate a large dataset and stream it to a JSON file in chunks
+
+    The file has the same schema as simulate(..., json=True). Overlap lengths are sampled directly from
+    their accepted distribution and each chunk of reads is generated with array operations, so memory use
+    is bounded by chunk_size rather than num_reads. The genes and every block of RNG_BLOCK_SIZE reads get
+    their own np.random.SeedSequence child, so the same seed always produces the same file, whatever the
+    chunk_size.
+
+    Parameters
+    ----------
+    save_path : str, path of the JSON file to write
+    num_epitopes : int, number of epitopes to simulate
+    num_v_genes : int, number of V genes to simulate
+    num_j_genes : int, number of J genes to simulate
+    num_reads : int, number of reads to simulate
+    len_read : int, length of the reads
+    seed : int, seed for the random number generator
+    chunk_size : int, number of reads generated and written at a time, rounded up to a multiple of RNG_BLOCK_SIZE
+    """
+    gene_seed, overlap_seed, random_seed = np.random.SeedSequence(seed).spawn(3)
+    rng = np.random.default_rng(gene_seed)
+    epitopes = simulate_epitopes_batched(num_epitopes, rng)
+    v_genes = simulate_vj_genes_batched(num_v_genes, len_read, epitopes, 'V', rng)
+    j_genes = simulate_vj_genes_batched(num_j_genes, len_read, epitopes, 'J', rng)
+    num_blocks = -(-num_reads // RNG_BLOCK_SIZE)
+    blocks_per_chunk = max(1, -(-chunk_size // RNG_BLOCK_SIZE))
+
+    def write_reads(f, block_seeds, simulate_block):
+        f.write('[')
+        for first_block in range(0, num_blocks, blocks_per_chunk):
+            chunk = []
+            for block in range(first_block, min(first_block + blocks_per_chunk, num_blocks)):
+                start = block * RNG_BLOCK_SIZE
+                chunk.extend(simulate_block(min(RNG_BLOCK_SIZE, num_reads - start), np.random.default_rng(block_seeds[block]), start))
+            f.write((', ' if first_block > 0 else '') + ', '.join(json.dumps(r) for r in chunk))
+        f.write(']')
+
+    with open(save_path, 'w') as f:
+        f.write('{"epitopes": ' + json.dumps(epitopes))
+        f.write(', "v_genes": ' + json.dumps([v.__json__() for v in v_genes]))
+        f.write(', "j_genes": ' + json.dumps([j.__json__() for j in j_genes]))
+        f.write(', "overlap_reads": ')
+        write_reads(f, overlap_seed.spawn(num_blocks),
+                    lambda n, block_rng, start: simulate_overlap_reads_batched(n, len_read, v_genes, j_genes, block_rng, start))
+        f.write(', "random_reads": ')
+        write_reads(f, random_seed.spawn(num_blocks),
+                    lambda n, block_rng, start: simulate_random_reads_batched(n, len_read, block_rng, start))
+        f.write('}')
+
+
 if __name__ == "__main__":
     # num_epitopes = 10
     # num_v_genes = 10
@@ -0,0 +1,198 @@
+import numpy as np
+from collections.abc import Mapping
+from typing import Dict, Iterable, List
+
+
+class EpitopeReadIndex(Mapping):
+    """
+    Epitope-read incidence matrix in compressed sparse row (CSR) form
+
+    Row e lists the reads covered by epitope e, indices[indptr[e]:indptr[e+1]], sorted and without duplicates.
+    Epitopes and reads are interned to consecutive indices. Reads are numbered in the order they appear, overlap
+    reads first, so unlike build_epitope_reads_dict an overlap read and a random read with the same id never
+    collide. build_epitope_reads_dict keys both overlap read 0 and random read 0 as 0, so when both are recovered
+    the coverages counted on the index can be one higher than those counted on the dict. row() gives the read
+    indices of one epitope.
+
+    As a read-only Mapping, the index maps each epitope to the read keys that build_epitope_reads_dict would
+    hold for it (see read_keys). Epitopes are iterated in order of first appearance rather than in
+    build_epitope_reads_dict's order, so solvers can break ties differently on the two.
+    """
+    def __init__(self: object,
+                 epitopes: List[str],
+                 read_ids: np.ndarray,
+                 read_is_random: np.ndarray,
+                 indptr: np.ndarray,
+                 indices: np.ndarray) -> None:
+        self.epitopes = epitopes
+        self.epitope_index = {epitope: i for i, epitope in enumerate(epitopes)}
+        self.read_ids = read_ids
+        self.read_is_random = read_is_random
+        self.indptr = indptr
+        self.indices = indices
+
+    def __str__(self: object) -> str:
+        return f"EpitopeReadIndex(n_epitopes={self.n_epitopes}, n_reads={self.n_reads}, nnz={len(self.indices)})"
+
+    def __getitem__(self: object, epitope: str) -> np.ndarray:
+        return self.read_keys(self.row(epitope))
+
+    def __iter__(self: object) -> Iterable[str]:
+        return iter(self.epitopes)
+
+    def __len__(self: object) -> int:
+        return len(self.epitopes)
+
+    @property
+    def n_epitopes(self: object) -> int:
+        return len(self.epitopes)
+
+    @property
+    def n_reads(self: object) -> int:
+        return len(self.read_ids)
+
+    @property
+    def degrees(self: object) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def row(self: object, epitope: str) -> np.ndarray:
+        """
+        Sorted read indices covered by the epitope
+
+        Parameters
+        ----------
+        epitope : str, epitope
+        """
+        i = self.epitope_index[epitope]
+        return self.indices[self.indptr[i]:self.indptr[i+1]]
+
+    def reads_for(self: object, epitopes: Iterable[str]) -> np.ndarray:
+        """
+        Sorted read indices covered by any of the epitopes
+
+        Parameters
+        ----------
+        epitopes : Iterable[str], epitopes
+        """
+        rows = [self.row(epitope) for epitope in epitopes]
+        if not rows:
+            return np.empty(0, dtype=self.indices.dtype)
+        return np.unique(np.concatenate(rows))
+
+    def coverage(self: object, epitopes: Iterable[str]) -> int:
+        """
+        Number of reads covered by any of the epitopes
+
+        Parameters
+        ----------
+        epitopes : Iterable[str], epitopes
+        """
+        return len(self.reads_for(epitopes))
+
+    def top_epitopes(self: object, n: int) -> List[str]:
+        """
+        The n epitopes covering the most reads, ties in epitope order
+
+        Parameters
+        ----------
+        n : int, number of epitopes
+        """
+        order = np.argsort(-self.degrees, kind='stable')[:n]
+        return [self.epitopes[i] for i in order]
+
+    def read_keys(self: object, read_indices: np.ndarray) -> np.ndarray:
+        """
+        Convert read indices to the keys used by build_epitope_reads_dict, read id for overlap reads and
+        -read id for random reads. As in build_epitope_reads_dict, an overlap read and a random read with id 0
+        get the same key.
+
+        Parameters
+        ----------
+        read_indices : np.ndarray, read indices
+        """
+        return np.where(self.read_is_random[read_indices], -self.read_ids[read_indices], self.read_ids[read_indices])
+
+    def to_scipy(self: object):
+        """
+        The incidence matrix as a scipy.sparse.csr_matrix of shape (n_epitopes, n_reads)
+        """
+        from scipy.sparse import csr_matrix
+        return csr_matrix((np.ones(len(self.indices), dtype=bool), self.indices, self.indptr),
+                          shape=(self.n_epitopes, self.n_reads))
+
+    def save(self: object, path: str) -> None:
+        """
+        Save the index to a .npz file
+
+        Parameters
+        ----------
+        path : str, path of the .npz file
+        """
+        np.savez_compressed(path, epitopes=np.array(self.epitopes, dtype=str), read_ids=self.read_ids,
+                            read_is_random=self.read_is_random, indptr=self.indptr, indices=self.indices)
+
+    @classmethod
+    def load(cls, path: str) -> 'EpitopeReadIndex':
+        """
+        Load an index saved with EpitopeReadIndex.save
+
+        Parameters
+        ----------
+        path : str, path of the .npz file
+        """
+        with np.load(path) as f:
+            return cls(f['epitopes'].tolist(), f['read_ids'], f['read_is_random'], f['indptr'], f['indices'])
+
+
+def build_epitope_read_index(final_json: Dict) -> EpitopeReadIndex:
+    """
+    Build the epitope-read incidence matrix from the output of JunkReadRecovery
+
+    Epitopes are numbered in order of first appearance in the reads. Reads aligned to the same V and J genes
+    share their epitope lists, so the only Python pass over the reads is one dict lookup per read, interning its
+    (V epitopes, J epitopes) combination. NumPy then groups the reads by combination, and each row is the
+    concatenation of the read groups of the combinations containing the epitope, so no per (epitope, read) pair
+    array is ever built.
+
+    Parameters
+    ----------
+    final_json : Dict, output of JunkReadRecovery
+    """
+    reads = final_json['high_score_overlap'] + final_json['high_score_random']
+    epitope_index, combination_index = {}, {}
+    epitope_combinations = []
+
+    def intern_combination(read):
+        key = (tuple(read['v_gene_epi']), tuple(read['j_gene_epi']))
+        c = combination_index.get(key)
+        if c is None:
+            c = combination_index[key] = len(combination_index)
+            # dict.fromkeys drops an epitope on both the V and the J gene
+            for epitope in dict.fromkeys(key[0] + key[1]):
+                e = epitope_index.setdefault(epitope, len(epitope_index))
+                if e == len(epitope_combinations):
+                    epitope_combinations.append([])
+                epitope_combinations[e].append(c)
+        return c
+
+    read_combinations = np.fromiter((intern_combination(read) for read in reads), dtype=np.int64, count=len(reads))
+    read_ids = np.fromiter((read['read_id'] for read in reads), dtype=np.int64, count=len(reads))
+    read_is_random = np.arange(len(reads)) >= len(final_json['high_score_overlap'])
+    index_dtype = np.int32 if len(reads) < 2**31 else np.int64
+
+    # Reads grouped by combination, ascending within each group
+    reads_by_combination = np.argsort(read_combinations, kind='stable').astype(index_dtype)
+    group_ptr = np.zeros(len(combination_index) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(read_combinations, minlength=len(combination_index)), out=group_ptr[1:])
+    del read_combinations
+
+    rows = []
+    for combinations in epitope_combinations:
+        row = np.concatenate([reads_by_combination[group_ptr[c]:group_ptr[c+1]] for c in combinations])
+        if len(combinations) > 1:
+            row.sort()
+        rows.append(row)
+    indptr = np.zeros(len(epitope_index) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=indptr[1:])
+    indices = np.concatenate(rows) if rows else np.empty(0, dtype=index_dtype)
+    return EpitopeReadIndex(list(epitope_index), read_ids, read_is_random, indptr, indices)
@@ -1,7 +1,6 @@
 from typing import Dict, Set
 import json
-from JunkReadRecovery import JunkReadRecovery
-from BuildEpiReadDict import build_epitope_reads_dict
+from BuildEpiReadDict import build_epitope_reads_dict, is_epitope_read_index
 
 
 def greedy_max_coverage(epitope_reads_dict: Dict, k: int) -> Set:
@@ -11,7 +10,7 @@ def greedy_max_coverage(epitope_reads_dict: Dict, k: int) -> Set:
     Parameters
     ----------
     epitope_reads_dict : Dict
-        A dictionary with epitopes as keys and a list of reads as values.
+        A dictionary with epitopes as keys and a list of reads as values, or an EpitopeReadIndex.
     k : int
         The number of epitopes to select.
 
@@ -22,6 +21,8 @@ def greedy_max_coverage(epitope_reads_dict: Dict, k: int) -> Set:
     int
         The number of reads covered by the selected epitopes.
     """
+    if is_epitope_read_index(epitope_reads_dict):
+        return greedy_max_coverage_index(epitope_reads_dict, k)
     selected_epitopes = set()
     uncovered_reads = set(read for reads in epitope_reads_dict.values() for read in reads)
     best_coverage_sum = 0
@@ -41,8 +42,39 @@ def greedy_max_coverage(epitope_reads_dict: Dict, k: int) -> Set:
             best_coverage_sum += best_coverage
     return selected_epitopes, best_coverage_sum
 
+
+def greedy_max_coverage_index(index, k: int) -> Set:
+    """
+    Greedy max coverage on an EpitopeReadIndex, the counterpart of greedy_max_coverage.
+
+    The coverage can differ from greedy_max_coverage on the epitope_reads_dict of the same results: the index
+    counts overlap read 0 and random read 0 as two reads, the dict as one (see EpitopeReadIndex), and ties
+    between epitopes can be broken differently.
+
+    The newly covered reads of every epitope are counted at once with np.bincount over the CSR rows.
+    """
+    import numpy as np
+
+    selected_epitopes = set()
+    best_coverage_sum = 0
+    covered = np.zeros(index.n_reads, dtype=bool)
+    entry_rows = np.repeat(np.arange(index.n_epitopes), index.degrees)
+    for _ in range(k):
+        if index.n_epitopes == 0:
+            break
+        coverage = np.bincount(entry_rows, weights=~covered[index.indices], minlength=index.n_epitopes)
+        best = int(np.argmax(coverage))
+        if coverage[best] == 0:
+            break
+        selected_epitopes.add(index.epitopes[best])
+        covered[index.indices[index.indptr[best]:index.indptr[best+1]]] = True
+        best_coverage_sum += int(coverage[best])
+    return selected_epitopes, best_coverage_sum
+
 # Example usage
 if __name__ == "__main__":
+    from JunkReadRecovery import JunkReadRecovery
+
     with open('./Simulation/sim_3_7.json') as f:
         data = json.load(f)
 
@@ -1,20 +1,17 @@
-import numpy as np
+import os
 import sys
-from typing import List, Dict, Iterable, Tuple
+from typing import List, Dict, Iterable, Tuple, Callable
 import json
 sys.setrecursionlimit(100000)
-import tqdm
 
 from Read import Read
 from Gene import Gene
-from OverlapAlignment import OverlapVDJAlignment
-
-import concurrent
-from concurrent.futures import ProcessPoolExecutor
+from OverlapAlignment import OverlapVDJAlignment, OverlapVTail, OverlapJHead, VDJResult
 
 def JunkReadRecovery(match_reward: int, mismatch_penalty: int, indel_penalty: int,
                      overlap_match_score: int, overlap_mismatch_score: int, threshold: int,
-                     data: Dict, save_path: str|None = None, print_progress: bool = False) -> Dict:
+                     data: Dict, save_path: str|None = None, print_progress: bool = False,
+                     callback: Callable[[Dict, bool], None]|None = None, server: str|None = None) -> Dict:
     """
     Perform overlap alignment between V, D, and J genes and reads
 
@@ -29,33 +26,53 @@ def JunkReadRecovery(match_reward: int, mismatch_penalty: int, indel_penalty: in
     data : Dict, data
     save_path : str, path to save the results
     print_progress : bool, print progress
+    callback : Callable, called as callback(result, random) for each high score alignment as soon as it is done
+    server : str, address of an AlignmentServer to align on, defaults to the ALIGNMENT_SERVER environment variable
     """
-    final_json = AlignAllReads(match_reward, mismatch_penalty, indel_penalty, overlap_match_score, overlap_mismatch_score, data, print_progress=print_progress)
+    high_score_callback = None
+    if callback is not None:
+        def high_score_callback(result, random):
+            if result['final_score'] > threshold:
+                callback(result, random)
+    final_json = AlignAllReads(match_reward, mismatch_penalty, indel_penalty, overlap_match_score, overlap_mismatch_score, data,
+                               print_progress=print_progress, callback=high_score_callback, server=server)
     final_json_filtered = KeepHighScoreAlignments(final_json, threshold)
     if save_path is not None:
-        final_json_filtered_save = {
-            'high_score_overlap': final_json_filtered['high_score_overlap'],
-            'high_score_random': final_json_filtered['high_score_random'],
-            'all_epitopes': final_json_filtered['all_epitopes'],
-            'all_v_genes': [i.__json__() for i in final_json_filtered['all_v_genes']],
-            'all_j_genes': [i.__json__() for i in final_json_filtered['all_j_genes']]
-        }
-        with open(save_path+'_recovered.json', 'w') as f:
-            json.dump(final_json_filtered_save, f)
-
-        final_json_save = {
-            'overlap': final_json['overlap'],
-            'random': final_json['random'],
-            'all_epitopes': final_json['all_epitopes'],
-            'all_v_genes': [i.__json__() for i in final_json['all_v_genes']],
-            'all_j_genes': [i.__json__() for i in final_json['all_j_genes']]
-        }
-        with open(save_path+'_all.json', 'w') as f:
-            json.dump(final_json_save, f)
-            
+        SaveResults(final_json, final_json_filtered, save_path)
     return final_json_filtered
 
 
+def SaveResults(final_json: Dict, final_json_filtered: Dict, save_path: str) -> None:
+    """
+    Save all alignments and high score alignments to JSON files
+
+    Parameters
+    ----------
+    final_json : Dict, output of AlignAllReads
+    final_json_filtered : Dict, output of KeepHighScoreAlignments
+    save_path : str, path prefix, '_recovered.json' and '_all.json' are appended
+    """
+    final_json_filtered_save = {
+        'high_score_overlap': final_json_filtered['high_score_overlap'],
+        'high_score_random': final_json_filtered['high_score_random'],
+        'all_epitopes': final_json_filtered['all_epitopes'],
+        'all_v_genes': [i.__json__() for i in final_json_filtered['all_v_genes']],
+        'all_j_genes': [i.__json__() for i in final_json_filtered['all_j_genes']]
+    }
+    with open(save_path+'_recovered.json', 'w') as f:
+        json.dump(final_json_filtered_save, f)
+
+    final_json_save = {
+        'overlap': final_json['overlap'],
+        'random': final_json['random'],
+        'all_epitopes': final_json['all_epitopes'],
+        'all_v_genes': [i.__json__() for i in final_json['all_v_genes']],
+        'all_j_genes': [i.__json__() for i in final_json['all_j_genes']]
+    }
+    with open(save_path+'_all.json', 'w') as f:
+        json.dump(final_json_save, f)
+
+
 def KeepHighScoreAlignments(data: Dict, threshold: int) -> Dict:
     """
     Keep reads with high scores
@@ -83,9 +100,15 @@ def KeepHighScoreAlignments(data: Dict, threshold: int) -> Dict:
 
 def AlignAllReads(match_reward: int, mismatch_penalty: int, indel_penalty: int,
                   overlap_match_score: int, overlap_mismatch_score: int,
-                  data: dict, print_progress: bool) -> list:
+                  data: dict, print_progress: bool, callback: Callable[[Dict, bool], None]|None = None,
+                  server: str|None = None) -> list:
     """
     Perform overlap alignment between V, D, and J genes and reads
+
+    callback, if given, is called as callback(result, random) for each alignment as soon as it is done (on a server,
+    as soon as the chunk of reads it was aligned in is done).
+    server, or else the ALIGNMENT_SERVER environment variable, is the address of an AlignmentServer to align on
+    instead of a new process pool.
     """
     # Unpack data
     all_epitopes, all_v_genes, all_j_genes, overlap_reads, random_reads = \
@@ -97,21 +120,34 @@ def AlignAllReads(match_reward: int, mismatch_penalty: int, indel_penalty: int,
     overlap_reads = [Read(**d) if type(d) != Read else d for d in overlap_reads]
     random_reads = [Read(**d) if type(d) != Read else d for d in random_reads]
     
-    def align_reads(reads):
-        with ProcessPoolExecutor() as executor:
+    if server is None:
+        server = os.environ.get('ALIGNMENT_SERVER')
+
+    def align_reads(reads, random):
+        if server:
+            from AlignmentServer import AlignmentClient
+            with AlignmentClient(server) as client:
+                return client.align_reads(match_reward, mismatch_penalty, indel_penalty, overlap_match_score,
+                                          overlap_mismatch_score, all_v_genes, all_j_genes, reads,
+                                          None if callback is None else lambda result: callback(result, random))
+        import concurrent.futures
+        import tqdm
+        with concurrent.futures.ProcessPoolExecutor() as executor:
             futures = [executor.submit(AlignOneRead, match_reward, mismatch_penalty, indel_penalty,
                                        overlap_match_score, overlap_mismatch_score, all_v_genes, all_j_genes, read)
                        for read in reads]
             results = []
             for future in tqdm.tqdm(concurrent.futures.as_completed(futures), total=len(futures), disable=not print_progress):
                 results.append(future.result())
+                if callback is not None:
+                    callback(results[-1], random)
         return results
 
     print('Aligning overlap reads')
-    results_overlap = align_reads(overlap_reads)
+    results_overlap = align_reads(overlap_reads, False)
 
     print('\nAligning random reads')
-    results_random = align_reads(random_reads)
+    results_random = align_reads(random_reads, True)
 
     final_json = {
         'overlap': results_overlap,
@@ -126,7 +162,7 @@ def AlignAllReads(match_reward: int, mismatch_penalty: int, indel_penalty: int,
 
 def AlignOneRead(match_reward: int, mismatch_penalty: int, indel_penalty: int,
                  overlap_match_score: int, overlap_mismatch_score: int,
-                v_genes: Gene, j_genes: Gene, read: Read) -> Dict:
+                v_genes: Gene, j_genes: Gene, read: Read, branch_and_bound: bool = True) -> Dict:
     """
     Perform overlap alignment between V, D, and J genes and a read
 
@@ -140,8 +176,12 @@ def AlignOneRead(match_reward: int, mismatch_penalty: int, indel_penalty: int,
     v_genes : Gene, V genes
     j_genes : Gene, J genes
     read : Read, read
+    branch_and_bound : bool, use AlignOneReadBranchAndBound, which returns the same result faster
     """
-    best_score = -np.inf
+    if branch_and_bound:
+        return AlignOneReadBranchAndBound(match_reward, mismatch_penalty, indel_penalty,
+                                          overlap_match_score, overlap_mismatch_score, v_genes, j_genes, read)
+    best_score = float('-inf')
     best_result = None
     for v_gene in v_genes:
         for j_gene in j_genes:
@@ -152,6 +192,58 @@ def AlignOneRead(match_reward: int, mismatch_penalty: int, indel_penalty: int,
                 best_result = result
     return best_result
 
+
+# Index of the best V and J gene for the previous read aligned in this process, visited first for the next read
+previous_winners = {'V': 0, 'J': 0}
+
+
+def AlignOneReadBranchAndBound(match_reward: int, mismatch_penalty: int, indel_penalty: int,
+                               overlap_match_score: int, overlap_mismatch_score: int,
+                               v_genes: Gene, j_genes: Gene, read: Read) -> Dict:
+    """
+    Same result as the exhaustive search in AlignOneRead, found with a separable branch and bound
+
+    The final score of a (V, J) pair is the V tail score plus the J head score, and each depends on one gene only,
+    so the exhaustive search picks the first V gene with the best V tail score and the first J gene with the best
+    J head score. Each side is searched on its own, starting from the previous read's winner. Every other gene is
+    aligned with the best score so far as a cutoff, and OverlapAlignment abandons it as soon as it provably cannot
+    win. A gene earlier in the list than the current best may still win on a tie.
+
+    Parameters
+    ----------
+    match_reward : int, reward for matching nucleotides
+    mismatch_penalty : int, penalty for mismatching nucleotides
+    indel_penalty : int, penalty for indels
+    overlap_match_score : int, reward for matching nucleotides in the overlap region
+    overlap_mismatch_score : int, penalty for mismatching nucleotides in the overlap region
+    v_genes : Gene, V genes
+    j_genes : Gene, J genes
+    read : Read, read
+    """
+    if len(v_genes) == 0 or len(j_genes) == 0:
+        return None
+
+    def best_gene(genes, gene_type, align):
+        first = previous_winners[gene_type] if previous_winners[gene_type] < len(genes) else 0
+        best_index, best = first, align(genes[first], None, False)
+        for index in range(len(genes)):
+            if index == first:
+                continue
+            result = align(genes[index], best[0], index < best_index)
+            if result is not None and (result[0] > best[0] or (result[0] == best[0] and index < best_index)):
+                best_index, best = index, result
+        previous_winners[gene_type] = best_index
+        return best_index, best
+
+    v_index, (score_overlap_v, aligned_v_tail, aligned_read_head) = best_gene(
+        v_genes, 'V', lambda v_gene, cutoff, allow_tie: OverlapVTail(match_reward, mismatch_penalty, indel_penalty, overlap_match_score,
+                                                                     overlap_mismatch_score, v_gene, read, False, cutoff, allow_tie))
+    j_index, (score_overlap_j, aligned_read_tail, aligned_j_head) = best_gene(
+        j_genes, 'J', lambda j_gene, cutoff, allow_tie: OverlapJHead(match_reward, mismatch_penalty, indel_penalty, overlap_match_score,
+                                                                     overlap_mismatch_score, j_gene, read, False, cutoff, allow_tie))
+    return VDJResult(score_overlap_v, aligned_v_tail, aligned_read_head, score_overlap_j, aligned_read_tail, aligned_j_head,
+                     v_genes[v_index], j_genes[j_index], read)
+
 if __name__ == "__main__":
     with open('./Simulation/sim_10.json') as f:
         data = json.load(f)
@@ -1,5 +1,3 @@
-import pandas as pd
-import numpy as np
 import sys
 from typing import List, Dict, Iterable, Tuple
 import json
@@ -31,34 +29,92 @@ def OverlapVDJAlignment(match_reward: int, mismatch_penalty: int, indel_penalty:
     -------
     Tuple[int, str, str, List, str, str, List], score, aligned V tail, aligned read head, aligned read tail, aligned J head
     """
-    v_gene_seq, j_gene_seq, read_seq = v_gene.seq, j_gene.seq, read.seq
-    v_gene_epi, j_gene_epi, read_epi = v_gene.epitopes, j_gene.epitopes, read.epitopes
-    score_v_tail, aligned_v_tail, aligned_read_head = OverlapAlignment(match_reward, mismatch_penalty, indel_penalty, v_gene_seq, read_seq, print_details)
-    score_j_head, aligned_read_tail, aligned_j_head = OverlapAlignment(match_reward, mismatch_penalty, indel_penalty, read_seq, j_gene_seq, print_details)
-    score_overlap_v, score_overlap_j = 0, 0
-    if len(aligned_v_tail) > 0 and len(aligned_read_head) > 0:
-        score_overlap_v = sum([overlap_match_score if aligned_v_tail[i] == aligned_read_head[i] else -overlap_mismatch_score for i in range(len(aligned_v_tail))])
-    if len(aligned_read_tail) > 0 and len(aligned_j_head) > 0:
-        score_overlap_j = sum([overlap_match_score if aligned_read_tail[i] == aligned_j_head[i] else -overlap_mismatch_score for i in range(len(aligned_read_tail))])
-    final_score = score_overlap_v + score_overlap_j
-    
+    score_overlap_v, aligned_v_tail, aligned_read_head = OverlapVTail(match_reward, mismatch_penalty, indel_penalty, overlap_match_score,
+                                                                      overlap_mismatch_score, v_gene, read, print_details)
+    score_overlap_j, aligned_read_tail, aligned_j_head = OverlapJHead(match_reward, mismatch_penalty, indel_penalty, overlap_match_score,
+                                                                      overlap_mismatch_score, j_gene, read, print_details)
+    return VDJResult(score_overlap_v, aligned_v_tail, aligned_read_head, score_overlap_j, aligned_read_tail, aligned_j_head,
+                     v_gene, j_gene, read)
+
+
+def VDJResult(score_overlap_v: int, aligned_v_tail: str, aligned_read_head: str,
+              score_overlap_j: int, aligned_read_tail: str, aligned_j_head: str,
+              v_gene: Gene, j_gene: Gene, read: Read) -> Dict:
+    """
+    Combine the V tail and J head alignments of a read into the OverlapVDJAlignment result
+    """
     result = {
-        'final_score': final_score,
-        'read_seq': read_seq,
+        'final_score': score_overlap_v + score_overlap_j,
+        'read_seq': read.seq,
         'read_id': read.id,
         'aligned_v_tail': aligned_v_tail,
         'aligned_read_head': aligned_read_head,
-        'v_gene_epi': v_gene_epi,
+        'v_gene_epi': v_gene.epitopes,
         'aligned_read_tail': aligned_read_tail,
         'aligned_j_head': aligned_j_head,
-        'j_gene_epi': j_gene_epi
+        'j_gene_epi': j_gene.epitopes
     }
     return result
 
 
+def OverlapVTail(match_reward: int, mismatch_penalty: int, indel_penalty: int,
+                 overlap_match_score: int, overlap_mismatch_score: int,
+                 v_gene: Gene, read: Read, print_details,
+                 cutoff: float|None = None, allow_tie: bool = False) -> Tuple[int, str, str]|None:
+    """
+    Overlap align the tail of a V gene with the head of a read and score the overlap region
+
+    Returns
+    -------
+    Tuple[int, str, str], overlap score, aligned V tail, aligned read head.
+    None if cutoff is given and the overlap score provably cannot beat it (or tie it, if allow_tie).
+    """
+    alignment = OverlapAlignment(match_reward, mismatch_penalty, indel_penalty, v_gene.seq, read.seq, print_details,
+                                 overlap_match_score, overlap_mismatch_score, cutoff, allow_tie)
+    if alignment is None:
+        return None
+    _, aligned_v_tail, aligned_read_head = alignment
+    score_overlap_v = 0
+    if len(aligned_v_tail) > 0 and len(aligned_read_head) > 0:
+        score_overlap_v = OverlapScore(overlap_match_score, overlap_mismatch_score, aligned_v_tail, aligned_read_head)
+    return score_overlap_v, aligned_v_tail, aligned_read_head
+
+
+def OverlapJHead(match_reward: int, mismatch_penalty: int, indel_penalty: int,
+                 overlap_match_score: int, overlap_mismatch_score: int,
+                 j_gene: Gene, read: Read, print_details,
+                 cutoff: float|None = None, allow_tie: bool = False) -> Tuple[int, str, str]|None:
+    """
+    Overlap align the tail of a read with the head of a J gene and score the overlap region
+
+    Returns
+    -------
+    Tuple[int, str, str], overlap score, aligned read tail, aligned J head.
+    None if cutoff is given and the overlap score provably cannot beat it (or tie it, if allow_tie).
+    """
+    alignment = OverlapAlignment(match_reward, mismatch_penalty, indel_penalty, read.seq, j_gene.seq, print_details,
+                                 overlap_match_score, overlap_mismatch_score, cutoff, allow_tie)
+    if alignment is None:
+        return None
+    _, aligned_read_tail, aligned_j_head = alignment
+    score_overlap_j = 0
+    if len(aligned_read_tail) > 0 and len(aligned_j_head) > 0:
+        score_overlap_j = OverlapScore(overlap_match_score, overlap_mismatch_score, aligned_read_tail, aligned_j_head)
+    return score_overlap_j, aligned_read_tail, aligned_j_head
+
+
+def OverlapScore(overlap_match_score: int, overlap_mismatch_score: int, aligned_s: str, aligned_t: str) -> int:
+    """
+    Score an alignment column by column, gaps count as mismatches
+    """
+    return sum([overlap_match_score if aligned_s[i] == aligned_t[i] else -overlap_mismatch_score for i in range(len(aligned_s))])
+
+
 def OverlapAlignment(match_reward: int, mismatch_penalty: int, indel_penalty: int,
                     s: str, t: str,
-                    print_details) -> Tuple[int, str, str]:
+                    print_details,
+                    overlap_match_score: int = 0, overlap_mismatch_score: int = 0,
+                    cutoff: float|None = None, allow_tie: bool = False) -> Tuple[int, str, str]|None:
     """
     Perform overlap alignment between two sequences
     
@@ -70,10 +126,20 @@ def OverlapAlignment(match_reward: int, mismatch_penalty: int, indel_penalty: in
     s : str, first sequence
     t : str, second sequence
     print_details : bool, print details of the alignment
+    overlap_match_score : int, reward for matching nucleotides in the overlap region, only used with cutoff
+    overlap_mismatch_score : int, penalty for mismatching nucleotides in the overlap region, only used with cutoff
+    cutoff : float, abandon the alignment once its OverlapScore provably cannot exceed cutoff
+    allow_tie : bool, keep the alignment if its OverlapScore can still equal cutoff
     
     Returns
     -------
-    Tuple[int, str, str], score, aligned s, aligned t
+    Tuple[int, str, str], score, aligned s, aligned t.
+    None if the alignment was abandoned because of cutoff.
+
+    The alignment ends in the last row at column max_j and may start in any row, so after row i its
+    OverlapScore is at most (overlap_match_score + overlap_mismatch_score) * LCS(s[:i], t[:j])
+    - overlap_mismatch_score * j + overlap_match_score * min(len(s) - i, len(t) - j) for the column j
+    where it enters row i. The maximum of that over j is checked against cutoff after every row.
     """
     score_matrix, backtrack_matrix = [[0 for j in range(len(t)+1)] for i in range(len(s)+1)], [[0 for j in range(len(t)+1)] for i in range(len(s)+1)]
     max_score, max_i, max_j = float('-inf'), -1, -1
@@ -82,6 +148,18 @@ def OverlapAlignment(match_reward: int, mismatch_penalty: int, indel_penalty: in
     for j in range(len(t)+1):
         score_matrix[0][j] = -j * indel_penalty
 
+    prune = cutoff is not None and overlap_match_score >= 0 and overlap_mismatch_score >= 0
+    if prune:
+        # Bit-parallel LCS: after row i, LCS(s[:i], t[:j]) is j minus the number of set bits of lcs_bits below bit j
+        t_masks = {}
+        for j, c in enumerate(t):
+            t_masks[c] = t_masks.get(c, 0) | (1 << j)
+        all_bits = (1 << len(t)) - 1
+        lcs_bits = all_bits
+
+    def below_cutoff(bound):
+        return bound < cutoff or (bound == cutoff and not allow_tie)
+
     for i in range(1, len(s)+1):
         for j in range(1, len(t)+1):
             score_matrix[i][j] = max(score_matrix[i-1][j] - indel_penalty, 
@@ -96,6 +174,18 @@ def OverlapAlignment(match_reward: int, mismatch_penalty: int, indel_penalty: in
                 backtrack_matrix[i][j] = 2
             elif score_matrix[i][j] == score_matrix[i-1][j] - indel_penalty:
                 backtrack_matrix[i][j] = 1
+        if prune:
+            matched = lcs_bits & t_masks.get(s[i-1], 0)
+            lcs_bits = ((lcs_bits + matched) | (lcs_bits - matched)) & all_bits
+            # The j = 0 term alone is overlap_match_score * min(len(s) - i, len(t)), skip the full bound while it passes
+            if below_cutoff(overlap_match_score * min(len(s)-i, len(t))):
+                bound, lcs = overlap_match_score * min(len(s)-i, len(t)), 0
+                for j in range(1, len(t)+1):
+                    lcs += not (lcs_bits >> (j-1)) & 1
+                    bound = max(bound, (overlap_match_score + overlap_mismatch_score) * lcs - overlap_mismatch_score * j
+                                + overlap_match_score * min(len(s)-i, len(t)-j))
+                if below_cutoff(bound):
+                    return None
     if print_details:
         def print_matrix(matrix):
             for row in matrix:
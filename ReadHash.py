@@ -0,0 +1,47 @@
+"""
+splitmix64 hash of read ids, shared by StreamingCoverage and SketchCoverage
+
+ReadHash hashes one id with Python ints and ReadHashes hashes an array of ids with NumPy; both give the same
+64-bit value for the same id and seed. Negative ids (random reads) are hashed as their 64-bit two's complement.
+"""
+
+MASK = 0xFFFFFFFFFFFFFFFF
+GAMMA = 0x9E3779B97F4A7C15
+MIX_1 = 0xBF58476D1CE4E5B9
+MIX_2 = 0x94D049BB133111EB
+
+
+def SeedOffset(seed: int) -> int:
+    return ((seed + 1) * GAMMA) & MASK
+
+
+def ReadHash(read_id: int, seed: int = 0) -> int:
+    """
+    splitmix64 hash of a read id, as an int in [0, 2**64)
+
+    Parameters
+    ----------
+    read_id : int, read id, negative for random reads
+    seed : int, hash seed
+    """
+    x = (read_id + SeedOffset(seed)) & MASK
+    x = ((x ^ (x >> 30)) * MIX_1) & MASK
+    x = ((x ^ (x >> 27)) * MIX_2) & MASK
+    return x ^ (x >> 31)
+
+
+def ReadHashes(reads, seed: int = 0):
+    """
+    splitmix64 hashes of read ids, as a uint64 array
+
+    Parameters
+    ----------
+    reads : np.ndarray, read ids, negative for random reads
+    seed : int, hash seed
+    """
+    import numpy as np
+
+    x = np.asarray(reads).astype(np.int64).view(np.uint64) + np.uint64(SeedOffset(seed))
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(MIX_1)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(MIX_2)
+    return x ^ (x >> np.uint64(31))
@@ -0,0 +1,315 @@
+"""
+Sharded JunkReadRecovery across processes and hosts through a shared-filesystem work queue.
+
+    1. ShardReads splits the reads of a simulation into deterministic shards under a queue directory.
+    2. Any number of RunShardWorker processes, on any host that can see the queue directory, claim
+       shards by atomically renaming them from pending/ to claimed/, align them, and write partial
+       results to results/.
+    3. MergeShards combines the partial results into the same _recovered.json / _all.json files that
+       JunkReadRecovery(..., save_path=...) writes.
+
+Queue directory layout:
+    manifest.json               alignment parameters, epitopes, genes and number of shards
+    pending/shard_*.json        shards waiting for a worker
+    claimed/shard_*.json@OWNER  shards being aligned by worker OWNER, the file's mtime is the worker's heartbeat
+    results/shard_*.json        partial results of finished shards
+
+A local directory works as a stand-in for the shared filesystem, e.g.
+    python ShardedRecovery.py shard Simulation/sim_0.json queue --num-shards 8
+    python ShardedRecovery.py work queue &  python ShardedRecovery.py work queue
+    python ShardedRecovery.py merge queue results/sim_0
+"""
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, List
+
+from Gene import Gene
+from JunkReadRecovery import AlignAllReads, KeepHighScoreAlignments, SaveResults
+
+
+def ShardReads(data: Dict, queue_dir: str, num_shards: int,
+               match_reward: int, mismatch_penalty: int, indel_penalty: int,
+               overlap_match_score: int, overlap_mismatch_score: int, threshold: int) -> None:
+    """
+    Partition the reads into deterministic shards and enqueue them
+
+    Shard i holds the i-th contiguous block of overlap reads and the i-th contiguous block of random
+    reads, so the same data and num_shards always produce the same shards.
+
+    Parameters
+    ----------
+    data : Dict, data in the simulate(..., json=True) schema
+    queue_dir : str, queue directory on the shared filesystem
+    num_shards : int, number of shards
+    match_reward : int, reward for matching nucleotides
+    mismatch_penalty : int, penalty for mismatching nucleotides
+    indel_penalty : int, penalty for indels
+    overlap_match_score : int, reward for matching nucleotides in the overlap region
+    overlap_mismatch_score : int, penalty for mismatching nucleotides in the overlap region
+    threshold : int, threshold for the score
+    """
+    if os.path.exists(os.path.join(queue_dir, 'manifest.json')):
+        raise FileExistsError(f'{queue_dir} already contains a queue')
+    for sub_dir in ['pending', 'claimed', 'results']:
+        os.makedirs(os.path.join(queue_dir, sub_dir), exist_ok=True)
+
+    def to_json(items):
+        return [i.__json__() if hasattr(i, '__json__') else i for i in items]
+
+    def block(items, i):
+        return items[len(items) * i // num_shards:len(items) * (i + 1) // num_shards]
+
+    overlap_reads, random_reads = to_json(data['overlap_reads']), to_json(data['random_reads'])
+    for i in range(num_shards):
+        shard = {'overlap_reads': block(overlap_reads, i), 'random_reads': block(random_reads, i)}
+        WriteJsonAtomic(shard, os.path.join(queue_dir, 'pending', ShardName(i)))
+
+    # The manifest is written last, so workers never see a partially enqueued queue
+    manifest = {
+        'num_shards': num_shards,
+        'params': {
+            'match_reward': match_reward,
+            'mismatch_penalty': mismatch_penalty,
+            'indel_penalty': indel_penalty,
+            'overlap_match_score': overlap_match_score,
+            'overlap_mismatch_score': overlap_mismatch_score,
+            'threshold': threshold
+        },
+        'epitopes': data['epitopes'],
+        'v_genes': to_json(data['v_genes']),
+        'j_genes': to_json(data['j_genes'])
+    }
+    WriteJsonAtomic(manifest, os.path.join(queue_dir, 'manifest.json'))
+
+
+def ClaimShard(queue_dir: str, owner: str) -> str|None:
+    """
+    Claim one pending shard, return its name or None if the queue is empty
+
+    os.rename is atomic on POSIX filesystems (including NFS for renames within one directory tree),
+    so exactly one worker wins each shard, and the claim and its owner appear in one step.
+
+    Parameters
+    ----------
+    queue_dir : str, queue directory
+    owner : str, token naming this worker, without '@'
+    """
+    for shard_name in sorted(os.listdir(os.path.join(queue_dir, 'pending'))):
+        pending_path = os.path.join(queue_dir, 'pending', shard_name)
+        try:
+            # A rename keeps the mtime, so start the heartbeat before the shard becomes a claim
+            os.utime(pending_path)
+            os.rename(pending_path, ClaimedPath(queue_dir, shard_name, owner))
+        except FileNotFoundError:
+            continue
+        return shard_name
+    return None
+
+
+def ClaimedPath(queue_dir: str, shard_name: str, owner: str) -> str:
+    """
+    Path of a shard claimed by a worker
+
+    Parameters
+    ----------
+    queue_dir : str, queue directory
+    shard_name : str, shard name
+    owner : str, token naming the worker
+    """
+    return os.path.join(queue_dir, 'claimed', f'{shard_name}@{owner}')
+
+
+def RunShardWorker(queue_dir: str, max_shards: int|None = None, print_progress: bool = False,
+                   heartbeat_interval: float = 30) -> List[str]:
+    """
+    Claim and align shards until the queue is empty, return the names of the shards processed
+
+    While a shard is aligned, its claimed file is touched every heartbeat_interval seconds, so
+    RequeueStaleShards only requeues shards whose worker stopped, not shards that are merely slow.
+
+    Parameters
+    ----------
+    queue_dir : str, queue directory
+    max_shards : int, stop after this many shards
+    print_progress : bool, print progress
+    heartbeat_interval : float, seconds between touches of the claimed file
+    """
+    with open(os.path.join(queue_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    params = manifest['params']
+    v_genes = [Gene(**d) for d in manifest['v_genes']]
+    j_genes = [Gene(**d) for d in manifest['j_genes']]
+
+    owner = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex}'
+    processed = []
+    while max_shards is None or len(processed) < max_shards:
+        shard_name = ClaimShard(queue_dir, owner)
+        if shard_name is None:
+            break
+        claimed_path = ClaimedPath(queue_dir, shard_name, owner)
+        with open(claimed_path) as f:
+            shard = json.load(f)
+        data = {'epitopes': manifest['epitopes'], 'v_genes': v_genes, 'j_genes': j_genes,
+                'overlap_reads': shard['overlap_reads'], 'random_reads': shard['random_reads']}
+
+        stop_heartbeat = threading.Event()
+
+        def heartbeat():
+            while not stop_heartbeat.wait(heartbeat_interval):
+                try:
+                    os.utime(claimed_path)
+                except FileNotFoundError:
+                    # Requeued, any new claim has another worker's name
+                    break
+
+        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeat_thread.start()
+        try:
+            final_json = AlignAllReads(params['match_reward'], params['mismatch_penalty'], params['indel_penalty'],
+                                       params['overlap_match_score'], params['overlap_mismatch_score'],
+                                       data, print_progress=print_progress)
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+        WriteJsonAtomic({'overlap': final_json['overlap'], 'random': final_json['random']},
+                        os.path.join(queue_dir, 'results', shard_name))
+        try:
+            os.remove(claimed_path)
+        except FileNotFoundError:
+            # The claim was requeued while this worker was slow, the result is still valid
+            pass
+        processed.append(shard_name)
+    return processed
+
+
+def RequeueStaleShards(queue_dir: str, max_age: float) -> List[str]:
+    """
+    Move shards whose worker has not sent a heartbeat for max_age seconds back to pending, e.g. after a worker crashed
+
+    Shards that already have a result are never requeued. max_age should be several times the workers'
+    heartbeat_interval.
+
+    Parameters
+    ----------
+    queue_dir : str, queue directory
+    max_age : float, seconds without a heartbeat after which a claim is considered stale
+    """
+    requeued = []
+    now = time.time()
+    for claimed_name in sorted(os.listdir(os.path.join(queue_dir, 'claimed'))):
+        shard_name = claimed_name.partition('@')[0]
+        claimed_path = os.path.join(queue_dir, 'claimed', claimed_name)
+        if os.path.exists(os.path.join(queue_dir, 'results', shard_name)):
+            continue
+        try:
+            if now - os.path.getmtime(claimed_path) < max_age:
+                continue
+            os.rename(claimed_path, os.path.join(queue_dir, 'pending', shard_name))
+        except FileNotFoundError:
+            continue
+        requeued.append(shard_name)
+    return requeued
+
+
+def MergeShards(queue_dir: str, save_path: str|None = None) -> Dict:
+    """
+    Merge the partial results of all shards, return the same output as JunkReadRecovery
+
+    Parameters
+    ----------
+    queue_dir : str, queue directory
+    save_path : str, path to save the results
+    """
+    with open(os.path.join(queue_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    missing = [ShardName(i) for i in range(manifest['num_shards'])
+               if not os.path.exists(os.path.join(queue_dir, 'results', ShardName(i)))]
+    if missing:
+        raise RuntimeError(f'{len(missing)} of {manifest["num_shards"]} shards are not finished, e.g. {missing[0]}')
+
+    results_overlap, results_random = [], []
+    for i in range(manifest['num_shards']):
+        with open(os.path.join(queue_dir, 'results', ShardName(i))) as f:
+            result = json.load(f)
+        results_overlap.extend(result['overlap'])
+        results_random.extend(result['random'])
+
+    final_json = {
+        'overlap': sorted(results_overlap, key=lambda r: r['read_id']),
+        'random': sorted(results_random, key=lambda r: r['read_id']),
+        'all_epitopes': manifest['epitopes'],
+        'all_v_genes': [Gene(**d) for d in manifest['v_genes']],
+        'all_j_genes': [Gene(**d) for d in manifest['j_genes']]
+    }
+    final_json_filtered = KeepHighScoreAlignments(final_json, manifest['params']['threshold'])
+    if save_path is not None:
+        SaveResults(final_json, final_json_filtered, save_path)
+    return final_json_filtered
+
+
+def ShardName(i: int) -> str:
+    return f'shard_{i:06d}.json'
+
+
+def WriteJsonAtomic(obj: Dict, path: str) -> None:
+    """
+    Write a JSON file so that readers only ever see the complete file
+
+    Parameters
+    ----------
+    obj : Dict, object to write
+    path : str, destination path
+    """
+    tmp_path = f'{path}.tmp.{socket.gethostname()}.{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    shard_parser = subparsers.add_parser('shard', help='split a simulation into shards')
+    shard_parser.add_argument('data_path')
+    shard_parser.add_argument('queue_dir')
+    shard_parser.add_argument('--num-shards', type=int, required=True)
+    shard_parser.add_argument('--match-reward', type=int, default=2)
+    shard_parser.add_argument('--mismatch-penalty', type=int, default=4)
+    shard_parser.add_argument('--indel-penalty', type=int, default=3)
+    shard_parser.add_argument('--overlap-match-score', type=int, default=2)
+    shard_parser.add_argument('--overlap-mismatch-score', type=int, default=3)
+    shard_parser.add_argument('--threshold', type=int, default=24)
+
+    work_parser = subparsers.add_parser('work', help='claim and align shards until the queue is empty')
+    work_parser.add_argument('queue_dir')
+    work_parser.add_argument('--max-shards', type=int, default=None)
+    work_parser.add_argument('--requeue-after', type=float, default=None,
+                             help='first requeue shards whose worker has not sent a heartbeat for this many seconds')
+    work_parser.add_argument('--heartbeat-interval', type=float, default=30)
+
+    merge_parser = subparsers.add_parser('merge', help='merge shard results into _recovered.json/_all.json')
+    merge_parser.add_argument('queue_dir')
+    merge_parser.add_argument('save_path')
+
+    args = parser.parse_args()
+    if args.command == 'shard':
+        with open(args.data_path) as f:
+            data = json.load(f)
+        ShardReads(data, args.queue_dir, args.num_shards, args.match_reward, args.mismatch_penalty, args.indel_penalty,
+                   args.overlap_match_score, args.overlap_mismatch_score, args.threshold)
+    elif args.command == 'work':
+        if args.requeue_after is not None:
+            RequeueStaleShards(args.queue_dir, args.requeue_after)
+        processed = RunShardWorker(args.queue_dir, args.max_shards, print_progress=True,
+                                   heartbeat_interval=args.heartbeat_interval)
+        print(f'Processed {len(processed)} shards')
+    elif args.command == 'merge':
+        MergeShards(args.queue_dir, args.save_path)
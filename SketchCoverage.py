@@ -0,0 +1,174 @@
+import math
+import numpy as np
+from itertools import combinations
+from typing import Dict, Iterable, Mapping, Set, Tuple
+
+from BuildEpiReadDict import is_epitope_read_index
+from ReadHash import ReadHashes
+
+
+class KMVSketch:
+    """
+    k-minimum-values sketch of a set of read ids
+
+    Keeps the size smallest 64-bit hashes of the ids. Sketches of two sets merge into the sketch of their union,
+    sets with fewer than size ids are counted exactly, and larger sets are estimated with a relative standard
+    error of about 1 / sqrt(size - 2).
+    """
+    def __init__(self: object,
+                 size: int,
+                 hashes: np.ndarray) -> None:
+        self.size = size
+        self.hashes = hashes
+
+    def __str__(self: object) -> str:
+        return f"KMVSketch(size={self.size}, estimate={self.estimate()})"
+
+    @classmethod
+    def from_reads(cls, reads: Iterable[int], size: int, seed: int = 0) -> 'KMVSketch':
+        """
+        Sketch a collection of read ids
+
+        Parameters
+        ----------
+        reads : Iterable[int], read ids, duplicates are ignored
+        size : int, number of hashes kept
+        seed : int, hash seed, sketches are only mergeable if built with the same seed
+        """
+        hashes = np.unique(ReadHashes(np.asarray(list(reads) if not isinstance(reads, np.ndarray) else reads), seed))
+        return cls(size, hashes[:size])
+
+    def merge(self: object, other: 'KMVSketch') -> 'KMVSketch':
+        """
+        Sketch of the union of the two sketched sets
+
+        Parameters
+        ----------
+        other : KMVSketch, sketch built with the same size and seed
+        """
+        return KMVSketch(self.size, np.union1d(self.hashes, other.hashes)[:self.size])
+
+    def estimate(self: object) -> float:
+        """
+        Estimated number of distinct read ids in the sketched set
+        """
+        if len(self.hashes) < self.size:
+            return float(len(self.hashes))
+        return (self.size - 1) / ((float(self.hashes[-1]) + 1) / 2.0 ** 64)
+
+
+def sketch_size(epsilon: float) -> int:
+    """
+    Sketch size whose relative standard error is at most epsilon
+
+    Parameters
+    ----------
+    epsilon : float, relative standard error of a coverage estimate
+    """
+    return math.ceil(1 / epsilon ** 2) + 2
+
+
+def build_epitope_sketches(epitope_reads_dict: Mapping, epsilon: float = 0.05, seed: int = 0) -> Dict[str, KMVSketch]:
+    """
+    Build one KMV sketch per epitope from the output of build_epitope_reads_dict (or an EpitopeReadIndex)
+
+    Parameters
+    ----------
+    epitope_reads_dict : Mapping, epitopes as keys and read ids as values
+    epsilon : float, relative standard error of each coverage estimate
+    seed : int, hash seed
+    """
+    size = sketch_size(epsilon)
+    return {epitope: KMVSketch.from_reads(reads, size, seed) for epitope, reads in epitope_reads_dict.items()}
+
+
+def exact_coverage(epitope_reads_dict: Mapping, epitopes: Iterable[str]) -> int:
+    """
+    Exact number of reads covered by the epitopes
+
+    Parameters
+    ----------
+    epitope_reads_dict : Mapping, output of build_epitope_reads_dict or an EpitopeReadIndex
+    epitopes : Iterable[str], epitopes
+    """
+    if is_epitope_read_index(epitope_reads_dict):
+        return epitope_reads_dict.coverage(epitopes)
+    return len(set(read for epitope in epitopes for read in epitope_reads_dict[epitope]))
+
+
+def greedy_max_coverage_sketch(epitope_sketches: Dict[str, KMVSketch], k: int,
+                               epitope_reads_dict: Mapping|None = None) -> Tuple[Set, int]:
+    """
+    Greedy max coverage on sketch unions, the approximate counterpart of greedy_max_coverage
+
+    Each step keeps the candidate with the largest estimate, so the estimate returned for the selection is the
+    maximum of many noisy estimates and runs high, by more than epsilon when many candidates are close. Pass
+    epitope_reads_dict to get the exact coverage of the selection instead.
+
+    Parameters
+    ----------
+    epitope_sketches : Dict[str, KMVSketch], output of build_epitope_sketches
+    k : int, number of epitopes to select
+    epitope_reads_dict : Mapping, if given, the coverage of the final selection is recomputed exactly from it
+
+    Returns
+    -------
+    Set, the selected epitopes.
+    int, the estimated number of covered reads, or the exact number if epitope_reads_dict is given.
+    """
+    selected_epitopes = set()
+    covered = None
+    best_coverage_sum = 0.0
+    for _ in range(k):
+        best_epitope, best_union, best_estimate = None, None, best_coverage_sum
+        for epitope, sketch in epitope_sketches.items():
+            if epitope in selected_epitopes:
+                continue
+            union = sketch if covered is None else covered.merge(sketch)
+            estimate = union.estimate()
+            if estimate > best_estimate:
+                best_epitope, best_union, best_estimate = epitope, union, estimate
+        if best_epitope is None:
+            break
+        selected_epitopes.add(best_epitope)
+        covered, best_coverage_sum = best_union, best_estimate
+    if epitope_reads_dict is not None:
+        return selected_epitopes, exact_coverage(epitope_reads_dict, selected_epitopes)
+    return selected_epitopes, round(best_coverage_sum)
+
+
+def brute_force_max_coverage_sketch(epitope_sketches: Dict[str, KMVSketch], k: int,
+                                    epitope_reads_dict: Mapping|None = None) -> Tuple[Set, int]:
+    """
+    Exhaustive max coverage on sketch unions, the approximate counterpart of brute_force_max_coverage
+
+    Each combination is scored by merging k sketches of at most sketch_size(epsilon) hashes, instead of
+    building the union of the full read sets. The estimate returned is the maximum over all combinations, so it
+    is biased upward, by more than epsilon when many combinations are close. Pass epitope_reads_dict to get the
+    exact coverage of the selection instead.
+
+    Parameters
+    ----------
+    epitope_sketches : Dict[str, KMVSketch], output of build_epitope_sketches
+    k : int, number of epitopes to select
+    epitope_reads_dict : Mapping, if given, the coverage of the final selection is recomputed exactly from it
+
+    Returns
+    -------
+    Set, the selected epitopes.
+    int, the estimated number of covered reads, or the exact number if epitope_reads_dict is given.
+    """
+    max_coverage = 0.0
+    best_combination = set()
+    size = next(iter(epitope_sketches.values())).size if epitope_sketches else 0
+    for combination in combinations(epitope_sketches.keys(), k):
+        if not combination:
+            continue
+        union = KMVSketch(size, np.unique(np.concatenate([epitope_sketches[e].hashes for e in combination]))[:size])
+        estimate = union.estimate()
+        if estimate > max_coverage:
+            max_coverage = estimate
+            best_combination = set(combination)
+    if epitope_reads_dict is not None:
+        return best_combination, exact_coverage(epitope_reads_dict, best_combination)
+    return best_combination, round(max_coverage)
@@ -0,0 +1,103 @@
+from typing import Dict, Iterable, Set, Tuple
+import math
+from collections import defaultdict
+from BuildEpiReadDict import read_epitope_pairs
+from ReadHash import ReadHash
+from Greedy import greedy_max_coverage
+
+
+class StreamingMaxCoverage:
+    """
+    Streaming max coverage over (epitope, read_id) pairs with memory independent of the number of reads
+
+    Reads are subsampled by a hash of their id: a read is kept if its hash falls below 2**64 / 2**level, and
+    the level goes up whenever more than `capacity` reads are kept. A read is either kept with all of its
+    epitopes or dropped entirely, so the sample is a uniform subsample of the reads with rate 2**-level.
+    query() runs greedy_max_coverage on the sample and scales the coverage back up.
+
+    OPT for k epitopes covers at least k / m of the m epitopes' reads, so keeping about m log m / epsilon**2
+    reads leaves OPT with at least k log m / epsilon**2 sampled reads. At that size, every k-set's sampled
+    coverage is within epsilon * OPT of its scaled true coverage with high probability
+    (McGregor and Vu, 2017). Greedy on the sample is then a (1 - 1/e - epsilon)-approximation.
+    """
+    def __init__(self: object,
+                 k: int,
+                 epsilon: float = 0.1,
+                 capacity: int|None = None,
+                 seed: int = 0) -> None:
+        self.k = k
+        self.epsilon = epsilon
+        self.fixed_capacity = capacity
+        self.seed = seed
+        self.level = 0
+        self.sample = defaultdict(set)
+        self.epitopes = set()
+        self.num_pairs = 0
+
+    def __str__(self: object) -> str:
+        return f"StreamingMaxCoverage(k={self.k}, sampled_reads={len(self.sample)}, level={self.level}, epitopes={len(self.epitopes)})"
+
+    @property
+    def capacity(self: object) -> int:
+        if self.fixed_capacity is not None:
+            return self.fixed_capacity
+        m = max(len(self.epitopes), 2)
+        return math.ceil(m * math.log(m) / self.epsilon ** 2)
+
+    @property
+    def sampling_rate(self: object) -> float:
+        return 2.0 ** -self.level
+
+    def sampled(self: object, read_id: int) -> bool:
+        return ReadHash(read_id, self.seed) >> (64 - self.level) == 0 if self.level > 0 else True
+
+    def add(self: object, epitope: str, read_id: int) -> None:
+        """
+        Add one (epitope, read_id) pair, as emitted by build_epitope_reads_dict
+
+        Parameters
+        ----------
+        epitope : str, epitope
+        read_id : int, read id, negative for random reads
+        """
+        self.num_pairs += 1
+        self.epitopes.add(epitope)
+        if not self.sampled(read_id):
+            return
+        self.sample[read_id].add(epitope)
+        while len(self.sample) > self.capacity:
+            self.level += 1
+            self.sample = defaultdict(set, {read_id: epitopes for read_id, epitopes in self.sample.items() if self.sampled(read_id)})
+
+    def add_pairs(self: object, pairs: Iterable[Tuple[str, int]]) -> None:
+        """
+        Add (epitope, read_id) pairs, e.g. from iter_epitope_read_pairs
+
+        Parameters
+        ----------
+        pairs : Iterable[Tuple[str, int]], (epitope, read_id) pairs
+        """
+        for epitope, read_id in pairs:
+            self.add(epitope, read_id)
+
+    def add_result(self: object, result: Dict, random: bool) -> None:
+        """
+        Add one alignment result, usable as the callback of JunkReadRecovery
+
+        Parameters
+        ----------
+        result : Dict, result of AlignOneRead
+        random : bool, whether the read is a random read
+        """
+        self.add_pairs(read_epitope_pairs(result, random))
+
+    def query(self: object) -> Tuple[Set, int]:
+        """
+        The current best set of k epitopes and its estimated number of covered reads
+        """
+        epitope_reads_dict = defaultdict(list)
+        for read_id, epitopes in self.sample.items():
+            for epitope in epitopes:
+                epitope_reads_dict[epitope].append(read_id)
+        selected_epitopes, sampled_coverage = greedy_max_coverage(epitope_reads_dict, self.k)
+        return selected_epitopes, round(sampled_coverage / self.sampling_rate)
@@ -0,0 +1,198 @@
+"""
+Single entry point for the junk read recovery tools.
+
+    python cli.py simulate OUT.json --num-epitopes 20 --num-v-genes 20 --num-j-genes 20 --num-reads 1000 --seed 0
+    python cli.py recover SIM.json SAVE_PATH [--server ADDRESS]
+    python cli.py build-index SAVE_PATH_recovered.json INDEX.npz
+    python cli.py greedy SAVE_PATH_recovered.json|INDEX.npz K [--approx-error EPS [--verify]]
+    python cli.py brute-force SAVE_PATH_recovered.json|INDEX.npz K [--approx-error EPS [--verify]]
+    python cli.py eval SAVE_PATH_recovered.json K RESULT.json
+    python cli.py startup-time
+
+These tools are called thousands of times from workflow managers, so this module imports nothing beyond the
+standard library at load time. Each subcommand imports only the modules listed for it in SUBCOMMAND_MODULES,
+and data.json is read only by the simulators that need it. `startup-time` measures the cold start of every
+subcommand (a fresh interpreter importing its modules) against STARTUP_BUDGET_MS.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+SUBCOMMAND_MODULES = {
+    'simulate': ['DataSimulation'],
+    'recover': ['JunkReadRecovery'],
+    'build-index': ['EpitopeReadIndex'],
+    'greedy': ['BuildEpiReadDict', 'Greedy'],
+    'brute-force': ['BuildEpiReadDict', 'BruteForce'],
+    'eval': ['eval_algo'],
+}
+
+# Cold start budget in milliseconds, including interpreter startup. Subcommands that work on arrays pay for numpy.
+STARTUP_BUDGET_MS = {
+    'simulate': 250,
+    'recover': 100,
+    'build-index': 250,
+    'greedy': 100,
+    'brute-force': 100,
+    'eval': 100,
+}
+
+
+def load_coverage_input(path: str):
+    """
+    Load an EpitopeReadIndex from a .npz file, or build an epitope_reads_dict from a _recovered.json file
+
+    The index counts overlap read 0 and random read 0 separately and the dict does not, so the two can report
+    coverages that differ by one for the same results.
+    """
+    if path.endswith('.npz'):
+        from EpitopeReadIndex import EpitopeReadIndex
+        return EpitopeReadIndex.load(path)
+    from BuildEpiReadDict import build_epitope_reads_dict
+    with open(path) as f:
+        return build_epitope_reads_dict(json.load(f))
+
+
+def simulate(args) -> None:
+    from DataSimulation import simulate_to_file
+    simulate_to_file(args.out, args.num_epitopes, args.num_v_genes, args.num_j_genes, args.num_reads, args.len_read,
+                     seed=args.seed, chunk_size=args.chunk_size)
+
+
+def recover(args) -> None:
+    from JunkReadRecovery import JunkReadRecovery
+    with open(args.data) as f:
+        data = json.load(f)
+    final_json = JunkReadRecovery(args.match_reward, args.mismatch_penalty, args.indel_penalty,
+                                  args.overlap_match_score, args.overlap_mismatch_score, args.threshold,
+                                  data, save_path=args.save_path, print_progress=args.progress, server=args.server)
+    print(json.dumps({'high_score_overlap': len(final_json['high_score_overlap']),
+                      'high_score_random': len(final_json['high_score_random'])}))
+
+
+def build_index(args) -> None:
+    from EpitopeReadIndex import build_epitope_read_index
+    with open(args.recovered) as f:
+        index = build_epitope_read_index(json.load(f))
+    index.save(args.out)
+    print(index)
+
+
+def greedy(args) -> None:
+    epitope_reads_dict = load_coverage_input(args.input)
+    if args.approx_error is not None:
+        from SketchCoverage import build_epitope_sketches, greedy_max_coverage_sketch
+        sketches = build_epitope_sketches(epitope_reads_dict, args.approx_error)
+        selected_epitopes, num_covered = greedy_max_coverage_sketch(sketches, args.k, epitope_reads_dict if args.verify else None)
+    else:
+        from Greedy import greedy_max_coverage
+        selected_epitopes, num_covered = greedy_max_coverage(epitope_reads_dict, args.k)
+    print(json.dumps({'epitopes': sorted(selected_epitopes), 'num_covered': num_covered}))
+
+
+def brute_force(args) -> None:
+    epitope_reads_dict = load_coverage_input(args.input)
+    if args.approx_error is not None:
+        from SketchCoverage import build_epitope_sketches, brute_force_max_coverage_sketch
+        sketches = build_epitope_sketches(epitope_reads_dict, args.approx_error)
+        selected_epitopes, num_covered = brute_force_max_coverage_sketch(sketches, args.k, epitope_reads_dict if args.verify else None)
+    else:
+        from BruteForce import brute_force_max_coverage
+        selected_epitopes, num_covered = brute_force_max_coverage(epitope_reads_dict, args.k)
+    print(json.dumps({'epitopes': sorted(selected_epitopes), 'num_covered': num_covered}))
+
+
+def eval_(args) -> None:
+    from eval_algo import eval_algo
+    eval_algo(args.recovered, args.k, args.out)
+
+
+def startup_time(args) -> None:
+    """
+    Measure the cold start of each subcommand in a fresh interpreter, exit with status 1 if any is over budget
+    """
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    over_budget = False
+    for command, modules in SUBCOMMAND_MODULES.items():
+        code = 'import cli, ' + ', '.join(modules)
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=repo_dir, check=True)
+            times.append((time.perf_counter() - start) * 1000)
+        best = min(times)
+        over_budget |= best > STARTUP_BUDGET_MS[command]
+        print(f'{command:<12} {best:7.1f} ms  (budget {STARTUP_BUDGET_MS[command]} ms)'
+              + ('  OVER BUDGET' if best > STARTUP_BUDGET_MS[command] else ''))
+    sys.exit(1 if over_budget else 0)
+
+
+def add_alignment_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--match-reward', type=int, default=2)
+    parser.add_argument('--mismatch-penalty', type=int, default=4)
+    parser.add_argument('--indel-penalty', type=int, default=3)
+    parser.add_argument('--overlap-match-score', type=int, default=2)
+    parser.add_argument('--overlap-mismatch-score', type=int, default=3)
+    parser.add_argument('--threshold', type=int, default=24)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('simulate', help='simulate a dataset and stream it to a JSON file')
+    p.add_argument('out')
+    p.add_argument('--num-epitopes', type=int, required=True)
+    p.add_argument('--num-v-genes', type=int, required=True)
+    p.add_argument('--num-j-genes', type=int, required=True)
+    p.add_argument('--num-reads', type=int, required=True)
+    p.add_argument('--len-read', type=int, default=75)
+    p.add_argument('--seed', type=int, default=None)
+    p.add_argument('--chunk-size', type=int, default=50000)
+    p.set_defaults(func=simulate)
+
+    p = subparsers.add_parser('recover', help='align reads and keep high score alignments')
+    p.add_argument('data')
+    p.add_argument('save_path', help="prefix for the '_recovered.json' and '_all.json' outputs")
+    add_alignment_args(p)
+    p.add_argument('--server', default=None, help='address of a running AlignmentServer')
+    p.add_argument('--progress', action='store_true')
+    p.set_defaults(func=recover)
+
+    p = subparsers.add_parser('build-index', help='build an epitope-read index from a _recovered.json file')
+    p.add_argument('recovered')
+    p.add_argument('out')
+    p.set_defaults(func=build_index)
+
+    for name, func in [('greedy', greedy), ('brute-force', brute_force)]:
+        p = subparsers.add_parser(name, help=f'{name} max coverage on a _recovered.json file or an index')
+        p.add_argument('input')
+        p.add_argument('k', type=int)
+        p.add_argument('--approx-error', type=float, default=None,
+                       help='search on KMV sketch unions with this relative standard error instead of exact read sets; '
+                            'the reported coverage is the best of many estimates and runs high unless --verify is given')
+        p.add_argument('--verify', action='store_true', help='with --approx-error, count the final selection exactly')
+        p.set_defaults(func=func)
+
+    p = subparsers.add_parser('eval', help='compare brute force and greedy on a _recovered.json file')
+    p.add_argument('recovered')
+    p.add_argument('k', type=int)
+    p.add_argument('out')
+    p.set_defaults(func=eval_)
+
+    p = subparsers.add_parser('startup-time', help='measure the cold start of each subcommand')
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=startup_time)
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'verify', False) and args.approx_error is None:
+        parser.error('--verify requires --approx-error')
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
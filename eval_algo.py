@@ -1,7 +1,3 @@
-from concurrent.futures import ProcessPoolExecutor
-import concurrent
-from tqdm import tqdm
-
 from BuildEpiReadDict import build_epitope_reads_dict
 from BruteForce import brute_force_max_coverage
 from Greedy import greedy_max_coverage
@@ -56,6 +52,10 @@ def process_file(final_json_path, k, results_dir):
     eval_algo(os.path.join('./results/Alignment', final_json_path), k, save_path)
 
 if __name__ == "__main__":
+    from concurrent.futures import ProcessPoolExecutor
+    import concurrent
+    from tqdm import tqdm
+
     k_range = range(1, 11)
     all_final_jsons = os.listdir('./results/Alignment')
     all_final_jsons = [f for f in all_final_jsons if "recovered" in f]